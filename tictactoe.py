@@ -10,7 +10,8 @@
 #                       assess if a given environment position is game 
 #                       over. Simply states truths. Does not make 
 #                       any decisions. The key here is that the underlying
-#                       data structure is an array, but instead
+#                       data structure is a pair of bitboards (one 9-bit
+#                       integer per player), but instead
 #                       the clients manipulate the environment in a
 #                       more intuitive way (e.g., crawling through,
 #                       setting values by "cell index", understanding
@@ -19,15 +20,102 @@
 #                       to make basic selection decisions of the next move 
 #                       by accessing truths about the state of the
 #                       environment and assigning value to different
-#                       choices.
+#                       choices. Computer agents play from a perfect-play
+#                       table solved once at import.
 #            3 - Controller: a global controller that runs a 
 #                       game by resetting the environment, instantiating
 #                       two agents, and running a step-based 
 #                       simulation.
 #----------------------------------------------------------------------------
+import array
+import os
 import random
-from itertools import product
-import pandas as pd
+
+# Numba is opt-in (set TICTACTOE_NUMBA=1). On a 3x3 board importing it costs
+# more than it saves, so by default the kernels below run as plain Python
+if os.environ.get("TICTACTOE_NUMBA") == "1":
+    from numba import njit
+else:
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+#------------- Bitboard Kernels -------------------------------
+# Pure integer functions on the (x_bb, o_bb) bitboard pair that solve the
+# game on import. They live outside of the class so Numba can compile them
+# when enabled; _solve_values is the only one called from Python.
+
+# Bitboard with every cell set
+_FULL_BB = 0o777
+
+# Bitboard of each winning line (each row, each column, both diagonals)
+_WIN_MASKS = (0o700, 0o070, 0o007, 0o444, 0o222, 0o111, 0o421, 0o124)
+
+@njit(cache=True)
+def _has_line(bb):
+    for mask in _WIN_MASKS:
+        if (bb & mask) == mask:
+            return True
+    return False
+
+# Marks a position that _solve_values has not reached yet
+_UNSOLVED = -128
+
+# Negamax value of a position for the player about to move: positive if they
+# can force a win (larger the sooner it comes), 0 for a draw, negative if
+# lost. Every position reached is memoized in values, indexed by ternary code
+@njit(cache=True)
+def _solve_values(x_bb, o_bb, code, empty_count, values):
+    # values holds int8; widen it so every return has the same type
+    if values[code] != _UNSOLVED:
+        return int(values[code])
+    
+    if _has_line(x_bb) or _has_line(o_bb):
+        # The previous move completed a line
+        value = -(empty_count + 1)
+    elif empty_count == 0:
+        value = 0
+    else:
+        # X moves first, so X is next whenever an odd number of cells are empty
+        x_is_next = empty_count % 2 == 1
+        empty = ~(x_bb | o_bb) & _FULL_BB
+        value = _UNSOLVED
+        power = 1
+        for i in range(9):
+            bit = 1 << i
+            if empty & bit:
+                if x_is_next:
+                    child_value = -_solve_values(x_bb | bit, o_bb, code + power, empty_count - 1, values)
+                else:
+                    child_value = -_solve_values(x_bb, o_bb | bit, code + 2*power, empty_count - 1, values)
+                if child_value > value:
+                    value = child_value
+            power *= 3
+    
+    values[code] = value
+    return value
+
+#------------- Lookup Tables -------------------------------
+# 512-entry tables, one entry per single-player bitboard, precomputed on
+# import so Board can replace loops over the cells with a single lookup.
+
+# Decimal number with a 1 in the digit of each set cell (cell 0 leftmost),
+# indexed by bitboard, so an encoded board is built with integer arithmetic
+_DECIMAL_DIGITS = tuple(
+    sum(10**(8 - i) for i in range(9) if (bb >> i) & 1) for bb in range(_FULL_BB + 1)
+)
+
+# Ternary number with a 1 in the digit of each set cell (cell i is digit i),
+# indexed by bitboard; the ternary code of a whole board is
+# _TERNARY_DIGITS[x_bb] + 2*_TERNARY_DIGITS[o_bb]
+_TERNARY_DIGITS = tuple(
+    sum(3**i for i in range(9) if (bb >> i) & 1) for bb in range(_FULL_BB + 1)
+)
+
+# Whether each possible single-player bitboard contains a winning line,
+# indexed by bitboard, so a win check is a single lookup
+_LINE_LUT = tuple(
+    any((bb & mask) == mask for mask in _WIN_MASKS) for bb in range(_FULL_BB + 1)
+)
 
 class Board:
     #------------- Class Variables -------------------------------
@@ -38,59 +126,84 @@ class Board:
     X_SQUARE = 2
     O_SQUARE = 3
     
+    # Bitboard with every cell set (the kernels above use the same value)
+    FULL_BB = _FULL_BB
+    
+    # How each cell value is rendered
+    _VALUE_STRINGS = {BLANK_SQUARE: " ", X_SQUARE: "X", O_SQUARE: "O"}
+    
+    # Rendering works on the encoded board: translate each digit to its
+    # display character, then fill the cells of a prebuilt grid template
+    _RENDER_CHARS = str.maketrans({str(value): string for value, string in _VALUE_STRINGS.items()})
+    _RENDER_TEMPLATE = ("\n" + "_"*(2*COLMAX - 1) + "\n").join(["|".join(["{}"]*COLMAX)]*ROWMAX) + "\n"
+    
+    # Characters allowed in an encoded board
+    _VALID_CHARS = frozenset((str(BLANK_SQUARE), str(X_SQUARE), str(O_SQUARE)))
+    
+    # Translations from an encoded board to the binary digits of one player
+    _X_DIGITS = str.maketrans(str(BLANK_SQUARE) + str(X_SQUARE) + str(O_SQUARE), "010")
+    _O_DIGITS = str.maketrans(str(BLANK_SQUARE) + str(X_SQUARE) + str(O_SQUARE), "001")
+    
     #------------- Static Methods -------------------------------
     
     @staticmethod
-    def prepare_board_input_from_list(input_list):
-        return [input_list[i:i+3] for i in range(0, len(input_list), 3)]
+    def _cell_bit(row, col):
+        return 1 << (row*Board.COLMAX + col)
     
     @staticmethod
     def decode_board_string(board_string):
-        char_list = list(board_string)
-        int_list = [int(i) for i in char_list]
-        board_representation = Board.prepare_board_input_from_list(int_list)
-        return board_representation      
-    
-    @staticmethod
-    def _encode_board_object_list(board_as_list):
-        
-        # Validate there are no negatives in the diff
-        for element in board_as_list:
-            if element not in [
-                Board.BLANK_SQUARE, 
-                Board.X_SQUARE, 
-                Board.O_SQUARE
-            ]:
-                print("Error: Trying to encode invalid element {}".format(element))
-                return ""
-        
-        board_string_list = [str(i) for i in board_as_list]
-        board_string = ''.join(board_string_list)
-        return str(board_string)
+        # Unpack an encoded string into its (x_bb, o_bb) bitboard pair,
+        # where bit i of each bitboard is cell i in row-major order. Cell 0
+        # comes first in the string, so the binary digits are reversed
+        x_bb = int(board_string.translate(Board._X_DIGITS)[::-1], 2)
+        o_bb = int(board_string.translate(Board._O_DIGITS)[::-1], 2)
+        return x_bb, o_bb
     
     #-------------  Initialization  -------------------------------
     
+    # Build a board straight from trusted bitboards, skipping the
+    # decode and validation done by __init__
+    @staticmethod
+    def _from_bitboards(x_bb, o_bb):
+        board = Board.__new__(Board)
+        board.x_bb = x_bb
+        board.o_bb = o_bb
+        board._refresh_state()
+        return board
+    
     def __init__(self, encoded_string=""):
         self.reset()
         if encoded_string != "":
-            self.board = Board.decode_board_string(str(encoded_string))
-            assert self._is_board_valid()
-        self.next_value = self.which_value_is_next()
+            encoded_string = str(encoded_string)
+            self._check_encoding(encoded_string)
+            self.x_bb, self.o_bb = Board.decode_board_string(encoded_string)
+            self._refresh_state()
     
     # Reset environment to initial state
     def reset(self):
-        self.board = [[self.BLANK_SQUARE, self.BLANK_SQUARE, self.BLANK_SQUARE],  # First row
-             [self.BLANK_SQUARE, self.BLANK_SQUARE, self.BLANK_SQUARE],  # Second row
-             [self.BLANK_SQUARE, self.BLANK_SQUARE, self.BLANK_SQUARE]]  # Third row
+        # The board is held as two bitboards, one per player
+        self.x_bb = 0
+        self.o_bb = 0
+        self._refresh_state()
         return self
     
-    # Receive action and return next state and key information
-    def step(self, action):
+    # Recompute the quantities derived from the bitboards; must be called
+    # whenever the bitboards change so the cached values stay current
+    def _refresh_state(self):
+        # The ternary code is a small int that identifies the position
+        self.code = _TERNARY_DIGITS[self.x_bb] + 2*_TERNARY_DIGITS[self.o_bb]
+        self.next_value, self._winner, self._terminated = _STATE_LUT[self.code]
+    
+    # Receive action and return next state and key information; pass
+    # validate=False only for actions already known to be legal
+    def step(self, action, validate=True):
         row, col, value = action
-        next_state = self.safe_set_value(row, col, value)
+        if validate:
+            next_state = self.safe_set_value(row, col, value)
+        else:
+            next_state = self._unchecked_set(row*self.COLMAX + col, value)
 
-        terminated = next_state.is_terminated()
-        winner = next_state.winner()
+        winner, terminated = next_state.evaluate()
         
         if winner == value:
             reward = 1000
@@ -101,167 +214,87 @@ class Board:
     #------------- Cell Operations  -------------------------------     
     
     def is_cell_empty(self, row, col):
-        return int(self.board[row][col]) == self.BLANK_SQUARE
+        return not (self.x_bb | self.o_bb) & self._cell_bit(row, col)
     
-    def _is_board_valid(self):
-        # Is board correct size
-        
-        # Check row count
-        if len(self.board) != self.ROWMAX:
-            print("Error: Wrong row count")
-            return False
-        
-        # Check col count
-        for row in self.board:
-            if len(row) != self.COLMAX:
-                print("Error: Wrong col count")
-                return False
+    # Validators return nothing and raise ValueError on the first problem found
+    
+    def _check_encoding(self, encoded_string):
+        # Is encoding correct size
+        if len(encoded_string) != self.ROWMAX*self.COLMAX:
+            raise ValueError("Error: Wrong cell count {}".format(len(encoded_string)))
         
         # Are all cell values valid
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                if not self._is_cell_valid(i, j):
-                    return False
-        return True
+        for char in encoded_string:
+            if char not in self._VALID_CHARS:
+                raise ValueError("Error: Value {} illegal".format(char))
     
-    def _is_cell_valid(self, row, col):
+    def _check_cell(self, row, col):
         if not (row < self.ROWMAX and row >= 0):
-            print("Error: Row {} out of range".format(row))
-            return False
+            raise ValueError("Error: Row {} out of range".format(row))
         if not (col < self.COLMAX and col >= 0):
-            print("Error: Col {} out of range".format(col))
-            return False
-        return True
-    
-    def _is_set_value_valid(self, row, col, value):
-        if not self._is_cell_valid(row, col):
-            print("Error: Cell ({},{}) is not valid".format(row, col))
-            return False
+            raise ValueError("Error: Col {} out of range".format(col))
+    
+    def _check_set_value(self, row, col, value):
+        self._check_cell(row, col)
         if not(value in [self.X_SQUARE, self.O_SQUARE]):
-            print("Error: Value {} illegal".format(value))
-            return False
+            raise ValueError("Error: Value {} illegal".format(value))
         if not (self.is_cell_empty(row, col)):
-            print("Error: Cell ({},{}) is not empty".format(row, col))
-            return False
-        return True
+            raise ValueError("Error: Cell ({},{}) is not empty".format(row, col))
     
-    def _is_direction_valid(self, direction):
-        return direction in ["N", "S", "E", "W", "NE", "SE", "SW", "NW"]
-        
-    def _set_value(self, row, col, value):
-        self.board[row][col] = value
-        return True
-    
-    def _get_cell_index_adjacent(self, origin_row, origin_col, direction):
-        assert self._is_direction_valid(direction), "Direction {} illegal".format(direction)
-        
-        if direction == "N":        
-            new_row = origin_row - 1
-            new_col = origin_col
-        elif direction == "S":        
-            new_row = origin_row + 1
-            new_col = origin_col
-        elif direction =="E":        
-            new_row = origin_row
-            new_col = origin_col + 1
-        elif direction =="W":        
-            new_row = origin_row - 1
-            new_col = origin_col
-        elif direction =="NE":        
-            new_row = origin_row - 1
-            new_col = origin_col + 1
-        elif direction =="SE":        
-            new_row = origin_row + 1
-            new_col = origin_col + 1
-        elif direction =="SW":        
-            new_row = origin_row + 1
-            new_col = origin_col - 1
-        else: # Assume NW
-            new_row = origin_row - 1
-            new_col = origin_col - 1    
-        
-        if not self._is_cell_valid(new_row, new_col):
-            print("Error: Trying to reach invalid cell")
-            return None
-        return (new_row, new_col)      
-    
-    def _count_nonempty_cells(self):
-        ct = 0
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                if not self.is_cell_empty(i, j):
-                    ct += 1
-        return ct
+    # Place a value by cell index without any validation; callers must
+    # already know the cell is empty and the value is X or O
+    def _unchecked_set(self, index, value):
+        if value == self.X_SQUARE:
+            self.x_bb |= 1 << index
+        else:
+            self.o_bb |= 1 << index
+        self._refresh_state()
+        return self
     
     def get_value(self, row, col):
-        assert (self._is_cell_valid(row, col))
-        return self.board[row][col]
+        self._check_cell(row, col)
+        bit = self._cell_bit(row, col)
+        if self.x_bb & bit:
+            return self.X_SQUARE
+        elif self.o_bb & bit:
+            return self.O_SQUARE
+        else:
+            return self.BLANK_SQUARE
     
     def safe_set_value(self, row, col, value):
-        if not self._is_set_value_valid(row, col, value):
-            raise ValueError("Error: Not valid to set value {} to this cell ({},{})".format(value, row, col))
-        else:
-            self._set_value(row, col, value)
-            return self
+        self._check_set_value(row, col, value)
+        return self._unchecked_set(row*self.COLMAX + col, value)
 
-    def _to_list(self):
-        board_as_list = list()
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                board_as_list.append(self.get_value(i, j))
-        return board_as_list    
-    
     #------------- Rendering   -------------------------------
 
         
     def encode(self):
-        return self._encode_board_object_list(self._to_list())
+        # Every cell starts as a blank digit, and each piece adds its offset
+        # from blank. Bitboards cannot hold an invalid cell, so no validation
+        encoded = (
+            self.BLANK_SQUARE*_DECIMAL_DIGITS[self.FULL_BB]
+            + (self.X_SQUARE - self.BLANK_SQUARE)*_DECIMAL_DIGITS[self.x_bb]
+            + (self.O_SQUARE - self.BLANK_SQUARE)*_DECIMAL_DIGITS[self.o_bb]
+        )
+        return str(encoded)
           
     def value_to_string(self, value):
-        if int(value) == self.BLANK_SQUARE:
-            return " "
-        elif int(value) == self.X_SQUARE:
-            return "X"
-        elif int(value) == self.O_SQUARE:
-            return "O"
-        else:
-            return value
+        return self._VALUE_STRINGS.get(value, value)
     
+    # Return the board as text; callers decide whether to print it
     def render(self):
-        result = ""
-        for i in range(0, self.ROWMAX):
-            row = ""
-            for j in range(0, self.COLMAX):
-                value = str(self.get_value(i, j))
-                render_value = self.value_to_string(value)
-                row += render_value
-                if j < self.ROWMAX - 1:
-                    row += "|"
-            result += row + "\n"
-            if i < self.ROWMAX - 1:
-                rowborder = ""
-                for j in range(0, 2*self.COLMAX - 1):
-                    rowborder += "_"
-                result += rowborder + "\n"
-        print(result)
-        return result
+        return self._RENDER_TEMPLATE.format(*self.encode().translate(self._RENDER_CHARS))
 
     #------------- State Transitions  -------------------------------
   
-    def which_value_is_next(self):
-        count_X = 0
-        count_O = 0
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                value = self.get_value(i, j)
-                if int(value) == self.X_SQUARE:
-                    count_X += 1
-                elif int(value) == self.O_SQUARE:
-                    count_O += 1
-        if count_X > count_O:
+    def _compute_next_value(self):
+        if self.x_bb.bit_count() > self.o_bb.bit_count():
             return self.O_SQUARE
         else:
             return self.X_SQUARE
+    
+    def which_value_is_next(self):
+        return self.next_value
 
     # Generate the list of possible boards if the value is successfully placed
     # Warning: does not valid that the turn is correct for that value
@@ -270,163 +303,218 @@ class Board:
         # Next up value
         next_value = self.which_value_is_next()
         
-        # Maximum nine next states are possible
-        self_string = self.encode()
-        new_board_list = list()
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                new_board = Board(self_string)
-                if new_board.is_cell_empty(i, j):
-                    new_board.safe_set_value(i, j, next_value)
-                    new_board_list.append(new_board)
-        return new_board_list
+        # Maximum nine next states are possible, one per empty cell. The
+        # current board is already valid, so copy its bitboards directly
+        # rather than round-tripping through an encoded string
+        next_states = list()
+        empty = ~(self.x_bb | self.o_bb) & self.FULL_BB
+        while empty:
+            bit = empty & -empty
+            if next_value == self.X_SQUARE:
+                next_states.append(Board._from_bitboards(self.x_bb | bit, self.o_bb))
+            else:
+                next_states.append(Board._from_bitboards(self.x_bb, self.o_bb | bit))
+            empty ^= bit
+        return next_states
                
     def next_available_moves(self):
         next_states = self.next_available_states()
-        next_moves = [self.extract_move_transition(i) for i in next_states]
+        next_moves = [self.move_to(i) for i in next_states]
         return next_moves
-    
-    def get_first_observed_move(self):
-        for i in range(0, self.ROWMAX):
-            for j in range(0, self.COLMAX):
-                if not self.is_cell_empty(i, j):
-                    return (i, j, self.get_value(i, j))
 
     def equals(self, other_board):
-        return self.encode() == other_board.encode()
-                
-    # Return as a board, but if diff is invalid then return None
-    def diff(self, other):
-        self_encoded = [int(i) for i in list(str(self.encode()))]
-        other_encoded = [int(i) for i in list(str(other.encode()))]
-        result = [a - b + 1 for a, b in zip(other_encoded, self_encoded)] 
-        diff_board_input = Board._encode_board_object_list(result)
-        if diff_board_input == "":
-            return None
-        return Board(diff_board_input)
-    
-    # Ensure the two boards differ by only one move
-    def is_valid_transition(self, other):
-        diff = self.diff(other)
-        if diff is None:
-            return False
-        else:
-            return diff._count_nonempty_cells() == 1
-
-    def extract_move_transition(self, other):
-        if not self.is_valid_transition(other):
-            print("Invalid Transition")
-            return (-1, -1, -1)
-        diff = self.diff(other)
-        move_made = diff.get_first_observed_move()
-        return move_made
+        return self.code == other_board.code
+    
+    # Return the (row, col, value) move that turns this board into the other,
+    # which must add exactly one piece and otherwise leave the board unchanged
+    def move_to(self, other):
+        x_diff = other.x_bb ^ self.x_bb
+        o_diff = other.o_bb ^ self.o_bb
+        bit = x_diff | o_diff
+        if (
+            (x_diff & self.x_bb) or (o_diff & self.o_bb)  # Piece removed or replaced
+            or bit == 0 or (bit & (bit - 1))              # Not exactly one cell changed
+        ):
+            raise ValueError("Error: Invalid transition from {} to {}".format(self.encode(), other.encode()))
+        index = bit.bit_length() - 1
+        value = self.X_SQUARE if x_diff else self.O_SQUARE
+        return (index // self.COLMAX, index % self.COLMAX, value)
 
     #------------- End State Evaluation -------------------------------
     
-    def _is_three_match_in_line(self, origin_row, origin_col, direction):
-        first_value = self.get_value(origin_row, origin_col)
-        
-        # Check cell has nonzero value
-        if str(first_value) == '1':
-            return False, -1
-        
-        # Check two in a line
-        next_row, next_col = self._get_cell_index_adjacent(origin_row, origin_col, direction)
-        second_value = self.get_value(next_row, next_col)
-        if first_value != second_value:
-            return False, -1
-        else:
-            
-            # Check three in a line
-            next_row, next_col = self._get_cell_index_adjacent(next_row, next_col, direction)
-            third_value = self.get_value(next_row, next_col)
-            if second_value != third_value:
-                return False, -1
-            else:
-                return True, first_value
-    
     def _is_full(self):
-        return self._count_nonempty_cells() == self.ROWMAX*self.COLMAX
+        return (self.x_bb | self.o_bb) == self.FULL_BB
         
-    def winner(self):     
-        three_match_list = list()
-        # Generate all possible lines (each row, each column, both diagonals)
-        line_list = [(0, 0, "E"),
-                     (1, 0, "E"),
-                     (2, 0, "E"),
-                     (0, 0, "S"),
-                     (0, 1, "S"),
-                     (0, 2, "S"),
-                     (0, 0, "SE"),
-                     (2, 0, "NE")
-        ]
-        
-        for row, col, direction in line_list:
-            three_match_in_line, value = self._is_three_match_in_line(row, col, direction)
-            if three_match_in_line:
-                three_match_list.append((row, col, direction, value))
+    # Find the winner and whether the game is over in a single pass; a
+    # completed line ends the game, so fullness only matters without one
+    def _compute_evaluation(self):
+        if _LINE_LUT[self.x_bb]:
+            return self.X_SQUARE, True
+        if _LINE_LUT[self.o_bb]:
+            return self.O_SQUARE, True
+        return None, self._is_full()
+    
+    # Return (winner, terminated) together
+    def evaluate(self):
+        return self._winner, self._terminated
         
-        if len(three_match_list) > 0:
-            row, col, direction, value = three_match_list[0]
-            return value
-        else:
-            return None
+    def winner(self):
+        return self._winner
         
     def is_terminated(self):
-        full = self._is_full()
-        winner = self.winner()
+        return self._terminated
+
+#------------- State Table -------------------------------
+# There are only 3**9 ways to fill the board, so the derived state of every
+# one of them is computed once on import and looked up by ternary code.
+
+# Every way of filling the board as (x_bb, o_bb, ternary code), generated
+# directly as integers by walking each X bitboard and every O subset of the
+# cells X leaves free, so no impossible overlap is ever produced
+def _board_universe():
+    for x_bb in range(_FULL_BB + 1):
+        free = _FULL_BB & ~x_bb
+        o_bb = free
+        while True:
+            yield x_bb, o_bb, _TERNARY_DIGITS[x_bb] + 2*_TERNARY_DIGITS[o_bb]
+            if o_bb == 0:
+                break
+            o_bb = (o_bb - 1) & free
+
+def _build_state_table():
+    table = [None]*(3**(Board.ROWMAX*Board.COLMAX))
+    board = Board.__new__(Board)
+    for x_bb, o_bb, code in _board_universe():
+        board.x_bb = x_bb
+        board.o_bb = o_bb
+        winner, terminated = board._compute_evaluation()
+        table[code] = (board._compute_next_value(), winner, terminated)
+    return tuple(table)
 
-        return full or (winner is not None)
+# (next_value, winner, terminated) of every board, indexed by ternary code
+_STATE_LUT = _build_state_table()
+
+#------------- Perfect Play -------------------------------
+# Tic-tac-toe has only 5478 reachable positions, so the optimal policy is
+# solved once by negamax on import and looked up by the agents afterwards.
+
+def _solve_policy():
+    # Solve every position reachable from the empty board
+    values = array.array('b', [_UNSOLVED])*len(_STATE_LUT)
+    _solve_values(0, 0, 0, Board.ROWMAX*Board.COLMAX, values)
+    
+    # The best moves in each undecided position are those into the
+    # children that are worst for the opponent
+    policy = [None]*len(_STATE_LUT)
+    for x_bb, o_bb, code in _board_universe():
+        next_value, winner, terminated = _STATE_LUT[code]
+        if values[code] == _UNSOLVED or terminated:
+            continue
+        piece = 1 if next_value == Board.X_SQUARE else 2
+        best_value = None
+        best_moves = list()
+        for i in range(Board.ROWMAX*Board.COLMAX):
+            if (x_bb | o_bb) & (1 << i):
+                continue
+            child_value = -values[code + piece*_TERNARY_DIGITS[1 << i]]
+            move = divmod(i, Board.COLMAX)
+            if best_value is None or child_value > best_value:
+                best_value = child_value
+                best_moves = [move]
+            elif child_value == best_value:
+                best_moves.append(move)
+        policy[code] = tuple(best_moves)
+    return tuple(policy)
+
+# Best (row, col) moves for the player to move, indexed by ternary code
+# (Board.code); None for boards that are finished or cannot be reached
+POLICY = _solve_policy()
         
 class Agent:
+    #------------- Class Variables -------------------------------
+    
+    # Kinds of value stored in the transposition table: an exact value, or
+    # a lower/upper bound left behind by an alpha-beta cutoff
+    TT_EXACT = 0
+    TT_LOWER = 1
+    TT_UPPER = 2
     
     def __init__(self, name, is_human):
         self.name = name
         self.is_human = is_human
         
-    def make_value_judgment(self, next_state, my_value): 
-        # The value of a given state is the expected reward from the paths leading from that state
+        # Transposition table of (value, kind) search results keyed on
+        # ternary code, so positions reached by different move orders are
+        # only searched once
+        self._tt = dict()
         
-        # Therefore, if the state is terminal, then assign a real value
+    def make_value_judgment(self, next_state, my_value): 
+        # The value of a given state is the reward reached from it when both
+        # sides play perfectly from then on
         # 1 if I win
         # 0 if no one wins
+        # -1 if I lose
+        value = self._negamax(next_state.x_bb, next_state.o_bb, -1, 1)
         
-        # However, if a state is not terminal, then assess the subsequent states (i.e., opponent movespace)
-        # to see if there are any bad outcomes. If there are, then assign a negative value to that state so we 
-        # do not enable bad outcomes.
-        
-        terminated = next_state.is_terminated()
-        winner = next_state.winner()
+        # Negamax scores the state for whoever moves next, which is usually the opponent
+        if next_state.which_value_is_next() == my_value:
+            return value
+        else:
+            return -value
+    
+    # Negamax with alpha-beta pruning: the value of the state for the player
+    # about to move, searched within the (alpha, beta) window. Works on the
+    # bitboards directly so no Board is built for any searched position
+    def _negamax(self, x_bb, o_bb, alpha, beta):
+        code = _TERNARY_DIGITS[x_bb] + 2*_TERNARY_DIGITS[o_bb]
+        if code in self._tt:
+            value, kind = self._tt[code]
+            if kind == self.TT_EXACT:
+                return value
+            elif kind == self.TT_LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
         
+        next_value, winner, terminated = _STATE_LUT[code]
         if terminated:
-            if winner == my_value:
-                return 1
+            # A line can only have been completed by the previous player
+            value = 0 if winner is None else -1
+            self._tt[code] = (value, self.TT_EXACT)
+            return value
+        
+        original_alpha = alpha
+        value = -1
+        empty = ~(x_bb | o_bb) & _FULL_BB
+        while empty:
+            bit = empty & -empty
+            empty ^= bit
+            if next_value == Board.X_SQUARE:
+                child_value = -self._negamax(x_bb | bit, o_bb, -beta, -alpha)
             else:
-                return 0
-
-        else:  
-            further_states = next_state.next_available_states()
-            for further_state in further_states:
-                # If opponent's move ends the game, then very bad
-                if further_state.winner() != my_value and further_state.winner() is not None:
-                    return -1
-            return 0
+                child_value = -self._negamax(x_bb, o_bb | bit, -beta, -alpha)
+            value = max(value, child_value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        
+        if value <= original_alpha:
+            kind = self.TT_UPPER
+        elif value >= beta:
+            kind = self.TT_LOWER
+        else:
+            kind = self.TT_EXACT
+        self._tt[code] = (value, kind)
+        return value
 
     def assess_next_states(self, state, my_value):
-        next_states = state.next_available_states()
-        next_state_assessment = pd.DataFrame(columns=['agent', 'next_state', 'agent_value_judgment'])
-        
-        for next_state in next_states:
-            next_state_string = next_state.encode()
-            value_judgment = self.make_value_judgment(next_state, my_value)
-            new_row = pd.DataFrame({
-                'agent' : str(self.name),
-                'next_state': str(next_state_string), 
-                'agent_value_judgment' : str(value_judgment)
-            }, index=[0])
-            next_state_assessment = pd.concat([next_state_assessment, new_row], ignore_index=True)
-                    
-        return next_state_assessment
+        # Pair each candidate next state with this agent's value judgment of it
+        return [
+            (next_state, self.make_value_judgment(next_state, my_value))
+            for next_state in state.next_available_states()
+        ]
     
     def policy(self, state):
         my_value = state.which_value_is_next()
@@ -434,28 +522,36 @@ class Agent:
         if self.is_human:
             row = int(input("Which row do you want to place in (0, 1, or 2)"))
             col = int(input("Which col do you want to place in (0, 1, or 2)"))    
+        elif POLICY[state.code] is not None:
+            # Play a perfect move, breaking ties at random
+            row, col = random.choice(POLICY[state.code])
         else:
+            # Position cannot arise from the empty board, so judge it directly
             next_state_assessment = self.assess_next_states(state, my_value)
-            #print(next_state_assessment)
-
-            value_list = next_state_assessment['agent_value_judgment'].tolist()        
-            value_max_indices = [
-                index for index, current_value in enumerate(value_list) if current_value == max(value_list)
-            ]     
-            value_max_index = random.sample(value_max_indices, 1)[0]
-
-            # Extract the value-maximizing next state
-            value_max_state_encoded = str(next_state_assessment['next_state'].to_list()[value_max_index])
-            value_max_state = Board(value_max_state_encoded)
-            row, col, my_value = state.extract_move_transition(value_max_state)
+
+            # Extract a value-maximizing next state, breaking ties at random
+            value_max = max(value for _, value in next_state_assessment)
+            value_max_states = [
+                next_state for next_state, value in next_state_assessment if value == value_max
+            ]
+            value_max_state = random.choice(value_max_states)
+            row, col, my_value = state.move_to(value_max_state)
         return (row, col, my_value)
            
 class Controller:
     
-    def __init__(self, agents):
+    # Set verbose=False to play without printing, e.g. for bulk self-play
+    def __init__(self, agents, verbose=True):
         self.board = Board()
         self.agents = agents
         self.agent_index = 0
+        self.verbose = verbose
+    
+    # Reset the environment and the turn order for a new game
+    def reset(self):
+        self.board.reset()
+        self.agent_index = 0
+        return self
     
     def next_agent(self):
         # Retrieve the current item
@@ -466,28 +562,52 @@ class Controller:
 
         return item
     
+    # Play one game from the current board and return the winning value
+    # (None for a draw)
     def simulate(self):        
-        print("** Begin Game **")
-        # Render environment
-        self.board.render()
+        if self.verbose:
+            print("** Begin Game **")
+            # Render environment
+            print(self.board.render())
+        winner = None
         for _ in range(1000):
                     
             # Select action via policy
             agent = self.next_agent()
-            print(agent.name)
+            if self.verbose:
+                print(agent.name)
             action = agent.policy(self.board)
             
-            observation, reward, done = self.board.step(action)
-            self.board = observation
+            # Computer agents only choose legal moves, so only human input is validated.
+            # The board is updated in place, so self.board is never rebound and any
+            # reference to it stays valid across moves and resets
+            _, reward, done = self.board.step(action, validate=agent.is_human)
 
             winner = self.board.winner()
             
             # Render environment
-            self.board.render()
+            if self.verbose:
+                print(self.board.render())
             
             if done:
-                print("** Game Over! The winning value is {}**".format(winner))
+                if self.verbose:
+                    print("** Game Over! The winning value is {}**".format(winner))
                 break
+        return winner
+    
+    # Play n fresh games without printing and return the winning value of
+    # each, with BLANK_SQUARE standing in for a draw
+    def simulate_many(self, n):
+        winners = array.array('b')
+        verbose = self.verbose
+        self.verbose = False
+        try:
+            for _ in range(n):
+                winner = self.reset().simulate()
+                winners.append(Board.BLANK_SQUARE if winner is None else winner)
+        finally:
+            self.verbose = verbose
+        return winners
 
             
 def main():
@@ -498,4 +618,5 @@ def main():
     game = Controller(agents)
     game.simulate()  
     
-main()
+if __name__ == "__main__":
+    main()